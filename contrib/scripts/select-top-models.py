@@ -11,18 +11,35 @@ based on modctl compatibility criteria:
 """
 
 import json
+import logging
+import logging.handlers
+import os
 import re
+import sqlite3
 import sys
 import argparse
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from typing import List, Dict, Optional
 from huggingface_hub import HfApi
 
+logger = logging.getLogger("select_top_models")
+
 # Try to import ModelFilter, fall back to dict if not available
 try:
     from huggingface_hub import ModelFilter
 except ImportError:
     ModelFilter = None
 
+# Newer releases can return extra model properties directly from list_models
+LIST_MODELS_SUPPORTS_EXPAND = "expand" in inspect.signature(HfApi.list_models).parameters
+
+# Properties requested from list_models so candidates can be pre-filtered
+# without a per-model request (file sizes still need model_info)
+LIST_MODELS_EXPAND = ["siblings", "config", "downloads", "likes", "tags", "gated", "sha"]
+
 
 # Supported model file formats (based on pkg/modelfile/constants.go)
 SUPPORTED_FORMATS = [
@@ -34,6 +51,19 @@ SUPPORTED_FORMATS = [
     "onnx",
 ]
 
+# Model file extensions mapped to their format. PyTorch .bin files are handled
+# separately since they only count when they are pytorch_model*.bin weights
+EXT_TO_FORMAT = {
+    "safetensors": "safetensors",
+    "gguf": "gguf",
+    "onnx": "onnx",
+    "pt": "pt",
+    "pth": "pt",
+}
+
+# Formats in order of preference when a repository ships several of them
+FORMAT_PRIORITY = ("safetensors", "gguf", "onnx", "bin", "pt")
+
 # Model families known to work well with modctl
 KNOWN_FAMILIES = {
     "llama",
@@ -52,6 +82,107 @@ KNOWN_FAMILIES = {
     "stablelm",
 }
 
+# Matches any known family in a model name in a single scan; longer names are
+# tried first so that e.g. "qwen2" wins over "qwen"
+FAMILY_PATTERN = re.compile(
+    "|".join(re.escape(family) for family in sorted(KNOWN_FAMILIES, key=len, reverse=True))
+)
+
+# Common parameter size patterns: 7B, 8b, 13B, 0.5B, 1.1B, 350M, etc.
+PARAM_SIZE_PATTERN = re.compile(r'(\d+\.?\d*[BM])', re.IGNORECASE)
+
+# Number of concurrent HuggingFace Hub metadata requests
+DEFAULT_WORKERS = 16
+
+# Number of log records buffered before they are written to stderr
+LOG_BUFFER_CAPACITY = 64
+
+# Location of the on-disk model info cache
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "modctl", "hf_models.sqlite")
+
+
+class ModelInfoCache:
+    """SQLite-backed cache of model info keyed by (model_id, sha)."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The connection is shared by the worker threads and guarded by a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS model_info ("
+                "model_id TEXT NOT NULL, sha TEXT NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (model_id, sha))"
+            )
+
+    def get(self, model_id: str, sha: str) -> Optional[Dict]:
+        """Return the cached model info for the given revision, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM model_info WHERE model_id = ? AND sha = ?",
+                (model_id, sha),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, model_id: str, sha: str, data: Dict):
+        """Store the model info for the given revision."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO model_info (model_id, sha, data) VALUES (?, ?, ?)",
+                (model_id, sha, json.dumps(data)),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def model_info_to_dict(model_info) -> Dict:
+    """Keep only the model info fields used by the compatibility checks."""
+    return {
+        "siblings": [
+            {"rfilename": f.rfilename, "size": getattr(f, 'size', None)}
+            for f in (getattr(model_info, 'siblings', None) or [])
+        ],
+        "tags": getattr(model_info, 'tags', None) or [],
+        "config": getattr(model_info, 'config', None) or {},
+    }
+
+
+def fetch_model_info(
+    api: HfApi,
+    model_id: str,
+    cache: Optional[ModelInfoCache] = None,
+    summary=None,
+):
+    """
+    Fetch model info with file sizes, reusing cached results for unchanged repos.
+
+    With a cache, the summary (the list_models entry, or a cheap request
+    without file metadata when it lacks a sha) resolves the current sha along
+    with gated status, downloads and likes, which change without a new commit;
+    the expensive files_metadata request is only issued on a miss.
+    """
+    if cache is None:
+        return api.model_info(model_id, files_metadata=True)
+
+    if getattr(summary, 'sha', None) is None:
+        summary = api.model_info(model_id, files_metadata=False)
+    data = cache.get(model_id, summary.sha)
+    if data is None:
+        data = model_info_to_dict(api.model_info(model_id, files_metadata=True))
+        cache.put(model_id, summary.sha, data)
+
+    return SimpleNamespace(
+        siblings=[SimpleNamespace(**f) for f in data["siblings"]],
+        tags=data["tags"],
+        config=data["config"],
+        gated=getattr(summary, 'gated', False),
+        downloads=getattr(summary, 'downloads', 0),
+        likes=getattr(summary, 'likes', 0),
+    )
+
 
 def get_model_size_gb(model_info) -> Optional[float]:
     """Estimate model size in GB from model info."""
@@ -63,63 +194,46 @@ def get_model_size_gb(model_info) -> Optional[float]:
                     total_size += file.size
         return total_size / (1024 ** 3)  # Convert to GB
     except Exception as e:
-        print(f"Error: An error occurred in get_model_size_gb: {e}", file=sys.stderr)
+        logger.error(f"Error: An error occurred in get_model_size_gb: {e}")
         return None
 
 
-def has_config_json(model_info) -> bool:
-    """Check if model has config.json for auto-detection."""
-    try:
-        if hasattr(model_info, 'siblings') and model_info.siblings:
-            return any(f.rfilename == "config.json" for f in model_info.siblings)
-        return False
-    except Exception as e:
-        print(f"Error: An error occurred in has_config_json: {e}", file=sys.stderr)
-        return None
-
-
-def get_model_format(model_info) -> Optional[str]:
-    """Detect model format from repository files."""
-    try:
-        if not hasattr(model_info, 'siblings') or not model_info.siblings:
-            return None
-
-        # Check for each supported format
-        for file in model_info.siblings:
-            filename = file.rfilename.lower()
-            if filename.endswith('.safetensors'):
-                return "safetensors"
-            elif filename.endswith('.gguf'):
-                return "gguf"
-            elif filename.endswith('.onnx'):
-                return "onnx"
-            elif filename.endswith('.bin') and 'pytorch_model' in filename:
-                return "bin"
-            elif filename.endswith('.pt') or filename.endswith('.pth'):
-                return "pt"
+def scan_repo_files(filenames: List[str]) -> tuple[bool, Optional[str]]:
+    """
+    Check for config.json and detect the model format in one pass over the repository files.
 
-        return None
-    except Exception as e:
-        print(f"Error: An error occurred in get_model_format: {e}", file=sys.stderr)
-        return None
+    Returns:
+        (has_config_json, model_format) tuple
+    """
+    has_config = False
+    formats_present = set()
+
+    for filename in filenames:
+        if filename == "config.json":
+            has_config = True
+            continue
+        filename = filename.lower()
+        ext = filename.rpartition('.')[2]
+        format_type = EXT_TO_FORMAT.get(ext)
+        if format_type is None:
+            if ext != 'bin' or 'pytorch_model' not in filename:
+                continue
+            format_type = "bin"
+        formats_present.add(format_type)
+        # Nothing can outrank the preferred format
+        if has_config and format_type == FORMAT_PRIORITY[0]:
+            break
+
+    format_type = next((fmt for fmt in FORMAT_PRIORITY if fmt in formats_present), None)
+
+    return has_config, format_type
 
 
 def extract_param_size(model_id: str) -> Optional[str]:
     """Extract parameter size from model name or metadata."""
-    # Common patterns: 7B, 8B, 13B, 0.5B, 1.1B, etc.
-    patterns = [
-        r'(\d+\.?\d*[BM])',  # 7B, 8B, 0.5B
-        r'(\d+\.?\d*)b',     # 7b, 0.5b (lowercase)
-    ]
-
-    model_name = model_id.lower()
-    for pattern in patterns:
-        match = re.search(pattern, model_name)
-        if match:
-            size = match.group(1).upper()
-            if not size.endswith('B') and not size.endswith('M'):
-                size += 'B'
-            return size
+    match = PARAM_SIZE_PATTERN.search(model_id)
+    if match:
+        return match.group(1).upper()
 
     return None
 
@@ -135,58 +249,88 @@ def detect_family(model_info, model_id: str) -> Optional[str]:
 
         # Fallback to tags
         if hasattr(model_info, 'tags') and model_info.tags:
-            for tag in model_info.tags:
-                if tag in KNOWN_FAMILIES:
-                    return tag
+            tag = next((t for t in model_info.tags if t in KNOWN_FAMILIES), None)
+            if tag:
+                return tag
 
         # Last resort: parse from model name
-        model_name_lower = model_id.lower()
-        for family in KNOWN_FAMILIES:
-            if family in model_name_lower:
-                return family
-
-        return None
+        match = FAMILY_PATTERN.search(model_id.lower())
+        return match.group(0) if match else None
     except Exception as e:
-        print(f"Error: An error occurred in detect_family: {e}", file=sys.stderr)
+        logger.error(f"Error: An error occurred in detect_family: {e}")
         return None
 
 
-def is_compatible_model(api: HfApi, model_id: str, max_size_gb: float = 20.0) -> tuple[bool, Optional[Dict]]:
+def is_compatible_model(
+    api: HfApi,
+    model,
+    max_size_gb: float = 20.0,
+    cache: Optional[ModelInfoCache] = None,
+) -> tuple[bool, Optional[Dict]]:
     """
     Check if model is compatible with modctl.
 
+    Args:
+        api: HuggingFace Hub client
+        model: Model entry returned by list_models
+        max_size_gb: Maximum model size in GB
+        cache: Optional model info cache
+
     Returns:
         (is_compatible, model_metadata) tuple
     """
-    # Get all model information
-    try:
-        model_info = api.model_info(model_id, files_metadata=True)
-    except Exception as e:
-        print(f"Skipping {model_id}: Could not fetch model info: {e}", file=sys.stderr)
-        return False, None
+    model_id = model.id
 
+    # Checks run cheapest first: fields already on the list entry, then the
+    # file listing, and only then the model info request for file sizes.
     # Skip gated models that require authorization
-    if getattr(model_info, 'gated', False):
-        print(f"Skipping {model_id}: Model is gated and requires authorization", file=sys.stderr)
+    if getattr(model, 'gated', False):
+        logger.info(f"Skipping {model_id}: Model is gated and requires authorization")
         return False, None
 
-    # Check for config.json
-    if not has_config_json(model_info):
-        print(f"Skipping {model_id}: No config.json", file=sys.stderr)
-        return False, None
+    # Cheap pre-filter on the file listing, which does not include sizes.
+    # Expanded list_models entries already carry it.
+    siblings = getattr(model, 'siblings', None)
+    if siblings is not None:
+        filenames = [f.rfilename for f in siblings]
+    else:
+        try:
+            filenames = api.list_repo_files(model_id)
+        except Exception as e:
+            logger.info(f"Skipping {model_id}: Could not list repository files: {e}")
+            return False, None
+
+    has_config, format_type = scan_repo_files(filenames)
 
     # Check format
-    format_type = get_model_format(model_info)
     if not format_type:
-        print(f"Skipping {model_id}: No supported model format found", file=sys.stderr)
+        logger.info(f"Skipping {model_id}: No supported model format found")
+        return False, None
+
+    # Check for config.json
+    if not has_config:
+        logger.info(f"Skipping {model_id}: No config.json")
+        return False, None
+
+    # Get all model information, including file sizes
+    try:
+        model_info = fetch_model_info(api, model_id, cache, summary=model)
+    except Exception as e:
+        logger.info(f"Skipping {model_id}: Could not fetch model info: {e}")
+        return False, None
+
+    # The list entry may not have carried the gated flag
+    if getattr(model_info, 'gated', False):
+        logger.info(f"Skipping {model_id}: Model is gated and requires authorization")
         return False, None
 
     # Check size
     size_gb = get_model_size_gb(model_info)
     if size_gb and size_gb > max_size_gb:
-        print(f"Skipping {model_id}: Too large ({size_gb:.2f}GB > {max_size_gb}GB)", file=sys.stderr)
+        logger.info(f"Skipping {model_id}: Too large ({size_gb:.2f}GB > {max_size_gb}GB)")
         return False, None
 
+    # Only accepted models reach the family and parameter size detection
     # Detect family
     family = detect_family(model_info, model_id)
 
@@ -212,6 +356,8 @@ def select_top_models(
     max_size_gb: float = 20.0,
     sort_by: str = "downloads",
     task: Optional[str] = "text-generation",
+    workers: int = DEFAULT_WORKERS,
+    cache_path: Optional[str] = DEFAULT_CACHE_PATH,
 ) -> List[Dict]:
     """
     Select top models from HuggingFace Hub.
@@ -221,55 +367,74 @@ def select_top_models(
         max_size_gb: Maximum model size in GB
         sort_by: Sort criteria (downloads, likes, trending)
         task: Task filter (text-generation, image-classification, etc.)
+        workers: Number of concurrent model info requests
+        cache_path: Path of the model info cache, or None to disable caching
 
     Returns:
         List of model metadata dictionaries
     """
     api = HfApi()
+    cache = ModelInfoCache(cache_path) if cache_path else None
 
-    print(f"Fetching top {limit} models (sort by: {sort_by}, max size: {max_size_gb}GB)...", file=sys.stderr)
+    logger.info(f"Fetching top {limit} models (sort by: {sort_by}, max size: {max_size_gb}GB)...")
 
     # Fetch more models than needed to account for filtering
     fetch_limit = limit * 10
 
+    list_kwargs = {
+        "sort": sort_by,
+        "direction": -1,
+        "limit": fetch_limit,
+    }
+    if LIST_MODELS_SUPPORTS_EXPAND:
+        list_kwargs["expand"] = LIST_MODELS_EXPAND
+
     # Use ModelFilter if available, otherwise pass task as filter string
     if ModelFilter is not None:
         model_filter = ModelFilter(
             task=task,
             library="transformers",
         )
-        models = api.list_models(
-            filter=model_filter,
-            sort=sort_by,
-            direction=-1,
-            limit=fetch_limit,
-        )
+        models = api.list_models(filter=model_filter, **list_kwargs)
     else:
         # Older API without ModelFilter
-        models = api.list_models(
-            filter=task,
-            sort=sort_by,
-            direction=-1,
-            limit=fetch_limit,
-        )
+        models = api.list_models(filter=task, **list_kwargs)
+
+    # Materialize candidates so their metadata can be fetched concurrently,
+    # dropping repos returned more than once by the paginated listing
+    seen = set()
+    candidates = [model for model in models if model.id not in seen and not seen.add(model.id)]
 
     selected = []
-    checked = 0
 
-    for model in models:
-        checked += 1
-        print(f"Checking {checked}/{fetch_limit}: {model.id}...", file=sys.stderr)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(is_compatible_model, api, model, max_size_gb, cache)
+            for model in candidates
+        ]
+
+        # Consume results in ranking order so the selection stays deterministic
+        for checked, (model, future) in enumerate(zip(candidates, futures), start=1):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Checking {checked}/{len(candidates)}: {model.id}...")
+
+            is_compatible, metadata = future.result()
 
-        is_compatible, metadata = is_compatible_model(api, model.id, max_size_gb)
+            if is_compatible and metadata:
+                selected.append(metadata)
+                logger.info(f"✓ Added {model.id} ({len(selected)}/{limit})")
 
-        if is_compatible and metadata:
-            selected.append(metadata)
-            print(f"✓ Added {model.id} ({len(selected)}/{limit})", file=sys.stderr)
+                if len(selected) >= limit:
+                    break
 
-            if len(selected) >= limit:
-                break
+        # Drop requests that are no longer needed
+        for future in futures:
+            future.cancel()
 
-    print(f"\nSelected {len(selected)} compatible models", file=sys.stderr)
+    if cache is not None:
+        cache.close()
+
+    logger.info(f"\nSelected {len(selected)} compatible models")
     return selected
 
 
@@ -304,34 +469,63 @@ def main():
         "--output",
         help="Output file path (default: stdout)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of concurrent model info requests (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Do not read or write the model info cache ({DEFAULT_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Log every candidate as it is checked",
+    )
 
     args = parser.parse_args()
 
+    # Buffer progress messages instead of writing each line to stderr as it is
+    # logged; errors flush the buffer immediately
+    handler = logging.handlers.MemoryHandler(
+        capacity=LOG_BUFFER_CAPACITY,
+        target=logging.StreamHandler(sys.stderr),
+    )
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    logger.propagate = False
+
     try:
         models = select_top_models(
             limit=args.limit,
             max_size_gb=args.max_size,
             sort_by=args.sort_by,
             task=args.task,
+            workers=args.workers,
+            cache_path=None if args.no_cache else DEFAULT_CACHE_PATH,
         )
 
-        output = json.dumps(models, indent=2)
-
+        # Stream the JSON instead of building the whole document in memory
         if args.output:
             with open(args.output, 'w') as f:
-                f.write(output)
-            print(f"\nWrote {len(models)} models to {args.output}", file=sys.stderr)
+                json.dump(models, f, indent=2)
+            logger.info(f"\nWrote {len(models)} models to {args.output}")
         else:
-            print(output)
+            json.dump(models, sys.stdout, indent=2)
+            sys.stdout.write("\n")
 
         return 0
 
     except Exception as e:
-        print(f"Error: An error occurred in main: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+        logger.exception(f"Error: An error occurred in main: {e}")
         return 1
 
+    finally:
+        handler.flush()
+
 
 if __name__ == "__main__":
     sys.exit(main())